@@ -1,11 +1,15 @@
 from __future__ import annotations
 
+import asyncio
 import os
+import sys
 from pathlib import Path
 from typing import Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 
 from rag import CodeExplainerRAG, IngestionPayload
@@ -16,8 +20,38 @@ DATA_PATH = Path(
     or str(Path(__file__).parent.parent / "data" / "code_samples.json")
 )
 MODEL_NAME = os.getenv("CODE_EXPLAINER_EMBEDDER", "sentence-transformers/all-MiniLM-L6-v2")
+# Embedding backend: "onnx" (default), "openvino" or "torch"
+MODEL_BACKEND = os.getenv("CODE_EXPLAINER_BACKEND", "onnx").lower()
+# Each worker holds its own model and knowledge base, and /ingest only updates
+# the worker that served it, so keep one worker unless the store is read-only.
+WORKERS = int(os.getenv("CODE_EXPLAINER_WORKERS") or 1)
+
+# uvicorn imports this module again as "main" to serve it, so run it before
+# building the app and pipeline, which the launching process would never use.
+if __name__ == "__main__":
+    import uvicorn
+
+    if WORKERS > 1:
+        # Split the cores between workers instead of giving each a full set of torch threads
+        os.environ.setdefault("CODE_EXPLAINER_THREADS", str(max(1, (os.cpu_count() or 1) // WORKERS)))
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=WORKERS,
+        limit_concurrency=1000,
+        timeout_keep_alive=30,
+    )
+    sys.exit(0)
 
-app = FastAPI(title="Code Explainer AI", version="1.0.0", docs_url="/docs")
+app = FastAPI(
+    title="Code Explainer AI",
+    version="1.0.0",
+    docs_url="/docs",
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,8 +59,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# line_by_line payloads are long, repetitive text
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
-rag_pipeline = CodeExplainerRAG(data_path=DATA_PATH, embedder_name=MODEL_NAME)
+rag_pipeline = CodeExplainerRAG(data_path=DATA_PATH, embedder_name=MODEL_NAME, backend=MODEL_BACKEND)
 
 
 class ExplainRequest(BaseModel):
@@ -56,16 +92,31 @@ class IngestRequest(BaseModel):
     tags: list[str] = []
 
 
-@app.on_event("startup")
-async def startup() -> None:
-    """Load the RAG pipeline on startup."""
+async def load_knowledge_base() -> None:
+    """Load the RAG pipeline off the event loop; readiness flips when done."""
     try:
         print(f"Loading knowledge base from: {DATA_PATH}")
-        rag_pipeline.load()
+        await asyncio.to_thread(rag_pipeline.load)
         print("Knowledge base loaded successfully!")
     except Exception as e:
+        rag_pipeline.load_error = f"{type(e).__name__}: {e}"
         print(f"Error loading knowledge base: {e}")
-        raise
+
+
+@app.on_event("startup")
+async def startup() -> None:
+    """Start loading the knowledge base so the server can answer /health immediately."""
+    # Keep a reference so the task is not garbage-collected mid-load
+    app.state.load_task = asyncio.create_task(load_knowledge_base())
+
+
+def require_ready() -> None:
+    if rag_pipeline.load_error:
+        raise HTTPException(
+            status_code=503, detail=f"Knowledge base failed to load: {rag_pipeline.load_error}"
+        )
+    if not rag_pipeline.ready:
+        raise HTTPException(status_code=503, detail="Knowledge base is still loading")
 
 
 @app.on_event("shutdown")
@@ -75,14 +126,20 @@ async def shutdown() -> None:
 
 
 @app.get("/health")
-async def health() -> dict:
+async def health(response: Response) -> dict:
     """Health check endpoint."""
-    return {"status": "ok", "loaded": len(rag_pipeline.db.entries) > 0}
+    if rag_pipeline.load_error:
+        response.status_code = 503
+        return {"status": "error", "loaded": False, "error": rag_pipeline.load_error}
+    return {"status": "ok", "loaded": rag_pipeline.ready}
 
 
+# CPU-bound routes are plain functions so FastAPI runs them in its threadpool
+# instead of blocking the event loop.
 @app.post("/explain", response_model=ExplainResponse)
-async def explain(payload: ExplainRequest) -> ExplainResponse:
+def explain(payload: ExplainRequest) -> ExplainResponse:
     """Explain code using RAG."""
+    require_ready()
     if not payload.code.strip():
         raise HTTPException(status_code=400, detail="Code snippet cannot be empty")
 
@@ -91,8 +148,9 @@ async def explain(payload: ExplainRequest) -> ExplainResponse:
 
 
 @app.post("/ingest")
-async def ingest(payload: IngestRequest) -> dict:
+def ingest(payload: IngestRequest) -> dict:
     """Add new code example to knowledge base."""
+    require_ready()
     rag_pipeline.ingest(
         IngestionPayload(
             language=payload.language,
@@ -102,4 +160,5 @@ async def ingest(payload: IngestRequest) -> dict:
             tags=payload.tags,
         )
     )
-    return {"status": "ingested", "total_examples": len(rag_pipeline.db.entries)}
\ No newline at end of file
+    return {"status": "ingested", "total_examples": len(rag_pipeline.db.entries)}
+
@@ -2,11 +2,75 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
 import re
 
+import ahocorasick
+
 from vectordb import LocalVectorDB
 
+# Patterns used on every line of every request, compiled once at import
+_FUNC_NAME_RE = re.compile(r'(def|int|void|float|double|char|bool)\s+(\w+)\s*\(')
+_PARAMS_RE = re.compile(r'\(([^)]*)\)')
+_VAR_ASSIGN_RE = re.compile(r'(int|float|double|char|bool|var|let|const)?\s*(\w+)\s*[=:]\s*(.+)')
+_CALL_NAME_RE = re.compile(r'(\w+)\s*\(')
+_KEYWORD_RE = re.compile(r'\b(def|function|int|void|class)\s+(\w+)')
+_STRUCT_RE = re.compile(r'\b(def|function|int|void)\s+\w+\s*\(')
+_CODE_FUNC_RE = re.compile(r'(def|int|void|function)\s+(\w+)\s*\(')
+# Lines that start with a definition, for the recursive-call check
+_DEF_LINE_RE = re.compile(r'\s*(def|int|void)\s+\w+')
+
+# Classifies every stripped line of a snippet in one scan. Alternatives are
+# tried in _explain_line's priority order, so the named group that matches at
+# a line start is the branch that explains it.
+_LINE_KIND_RE = re.compile(
+    r'^(?:'
+    r'(?P<include>#include)'
+    r'|(?P<function>(?:def|int|void|float|double|char|bool)[^\S\n]+\w+[^\S\n]*\()'
+    r'|(?P<return>return )'
+    r'|(?P<conditional>if )'
+    r'|(?P<declaration>(?:int|float|double|char|bool|var|let|const)[^\S\n]+\w)'
+    r'|(?P<loop>for |while )'
+    r'|(?P<output>(?=.*(?:printf|cout|print\()))'
+    r'|(?P<call>(?=.*\w[^\S\n]*\([^)\n]*\))(?!.*=))'
+    r'|(?P<arithmetic>(?=.*[-+*/%]))'
+    r')',
+    re.MULTILINE,
+)
+
+# Algorithm names reported by _extract_keywords, in this order
+_ALGO_KEYWORDS = ("sort", "search", "fibonacci", "graph", "tree", "hash", "stack", "queue")
+
+# Keywords looked up in the lowercased source by the intent/pattern heuristics
+_LOWERED_KEYWORDS = frozenset({
+    *_ALGO_KEYWORDS,
+    "fib", "find", "node", "quicksort", "pivot", "mergesort", "merge", "binary",
+    "neighbor", "leaf", "push", "pop", "enqueue", "dequeue", "swap", "reverse",
+    "factorial", "fact", "malloc", "new ", "free", "delete ", "__init__", "constructor",
+})
+
+# Case-sensitive keywords looked up in the raw source. These are short and
+# common, so plain substring checks beat an automaton scan for them.
+_CODE_KEYWORDS = frozenset({
+    "class ", "template", "*", "[", "]", "int", "char", "if ", "if(", "else",
+    "for ", "while ", "return ", "main()", "int main",
+    # LanguageDetector fallbacks
+    "{", ":", "::", "#include", "namespace",
+})
+
+
+def _build_automaton(words: Iterable[str]) -> ahocorasick.Automaton:
+    automaton = ahocorasick.Automaton()
+    for word in words:
+        automaton.add_word(word, word)
+    automaton.make_automaton()
+    return automaton
+
+
+def _scan(automaton: ahocorasick.Automaton, text: str) -> frozenset[str]:
+    """Return every keyword of the automaton that occurs in text, in one linear pass."""
+    return frozenset(word for _, word in automaton.iter(text))
+
 
 @dataclass
 class IngestionPayload:
@@ -35,64 +99,103 @@ class LanguageDetector:
         "malloc", "free", "calloc", "realloc"
     ]
 
-    def detect(self, code: str) -> str:
+    # Indicators are matched against lowercased code
+    _PYTHON_KEYS = frozenset(indicator.lower() for indicator in PYTHON_INDICATORS)
+    _CPP_KEYS = frozenset(indicator.lower() for indicator in CPP_INDICATORS)
+    _C_KEYS = frozenset(indicator.lower() for indicator in C_INDICATORS)
+
+    def detect(self, code: str, features: Optional[CodeFeatures] = None) -> str:
         """Detect programming language with improved accuracy."""
-        lowered = code.lower()
+        features = features or CodeFeatures.from_code(code)
+        found = features.keywords
+        raw = features.code_keywords
         
         # Python detection (most distinct syntax)
-        if any(indicator.lower() in lowered for indicator in self.PYTHON_INDICATORS):
+        if found & self._PYTHON_KEYS:
             # Verify it's not C++ with class syntax
-            if "class " in code and "{" in code and "::" in code:
+            if "class " in raw and "{" in raw and "::" in raw:
                 return "c++"
             return "python"
         
         # C++ specific features (check before C)
-        if any(indicator.lower() in lowered for indicator in self.CPP_INDICATORS):
+        if found & self._CPP_KEYS:
             return "c++"
         
         # C-only features
-        if any(indicator.lower() in lowered for indicator in self.C_INDICATORS):
+        if found & self._C_KEYS:
             return "c"
         
         # Generic C/C++ patterns
-        if "#include" in code:
+        if "#include" in raw:
             # C++ has class with braces, namespaces, or templates
-            if ("class " in code and "{" in code) or "namespace" in code or "template" in code:
+            if ("class " in raw and "{" in raw) or "namespace" in raw or "template" in raw:
                 return "c++"
             # Default to C for simple includes
             return "c"
         
         # Python class syntax (no braces)
-        if "class " in code and ":" in code and "{" not in code:
+        if "class " in raw and ":" in raw and "{" not in raw:
             return "python"
         
         # Default fallback
         return "c"
 
 
+_LOWERED_AUTOMATON = _build_automaton(
+    _LOWERED_KEYWORDS | LanguageDetector._PYTHON_KEYS | LanguageDetector._CPP_KEYS | LanguageDetector._C_KEYS
+)
+
+
+@dataclass(frozen=True)
+class CodeFeatures:
+    """Per-request scan results shared by the analysis helpers."""
+    code: str
+    keywords: frozenset[str]
+    code_keywords: frozenset[str]
+    if_count: int
+    return_count: int
+
+    @classmethod
+    def from_code(cls, code: str) -> CodeFeatures:
+        return cls(
+            code=code,
+            keywords=_scan(_LOWERED_AUTOMATON, code.lower()),
+            code_keywords=frozenset(word for word in _CODE_KEYWORDS if word in code),
+            if_count=code.count("if "),
+            return_count=code.count("return"),
+        )
+
+
 class CodeExplainerRAG:
     """RAG-based code explanation system with detailed analysis."""
     
-    def __init__(self, data_path: Path, embedder_name: str) -> None:
+    def __init__(self, data_path: Path, embedder_name: str, backend: str = "onnx") -> None:
         self.data_path = data_path
         self.detector = LanguageDetector()
-        self.db = LocalVectorDB(data_path=data_path, embedder_name=embedder_name)
+        self.db = LocalVectorDB(data_path=data_path, embedder_name=embedder_name, backend=backend)
+        self.ready = False
+        # Set when load() fails, so callers can report it instead of "still loading"
+        self.load_error: Optional[str] = None
 
     def load(self) -> None:
         """Load the knowledge base and compute embeddings."""
         self.db.load()
+        self.ready = True
 
     def explain(self, code: str, language_hint: Optional[str]) -> dict:
         """Generate detailed explanation of code with RAG context."""
-        language = (language_hint or "").lower().strip() or self.detector.detect(code)
+        features = CodeFeatures.from_code(code)
+        language = (language_hint or "").lower().strip() or self.detector.detect(code, features)
         
         # Enhanced search query
-        search_query = f"{language} programming: {self._extract_keywords(code)} {code[:300]}"
-        context = self.db.search(query=search_query, top_k=5)
+        search_query = f"{language} programming: {self._extract_keywords(features)} {code[:300]}"
+        hits = self.db.search(query=search_query, top_k=5)
+        # Entries are append-only, so hit positions stay valid; no copies needed
+        context = [self.db.entries[hit.entry_id] for hit in hits]
 
         reasoning = [
             f"Detected language: {language}",
-            f"Analyzed code structure: {self._analyze_structure(code)}",
+            f"Analyzed code structure: {self._analyze_structure(features)}",
             f"Retrieved {len(context)} reference snippet(s) from knowledge base",
         ]
         
@@ -101,7 +204,7 @@ class CodeExplainerRAG:
         
         if not context:
             reasoning.append("No close references found, using heuristic analysis.")
-            summary = self._detailed_fallback_explanation(language, code)
+            summary = self._detailed_fallback_explanation(language, features)
             return {
                 "language": language,
                 "summary": summary,
@@ -111,21 +214,25 @@ class CodeExplainerRAG:
             }
 
         # Generate detailed explanation
-        detailed_analysis = self._generate_detailed_explanation(code, language, context)
+        detailed_analysis = self._generate_detailed_explanation(features, language, context)
         
         return {
             "language": language,
             "summary": detailed_analysis["summary"],
             "reasoning": reasoning + detailed_analysis["analysis_steps"],
             "line_by_line": line_by_line,
-            "references": context[:3]  # Top 3 most relevant
+            # Top 3 most relevant, materialized once for the response
+            "references": [{**entry, "score": hit.score} for entry, hit in zip(context[:3], hits)]
         }
 
     def _analyze_line_by_line(self, code: str, language: str, context: list[dict]) -> list[dict]:
         """Analyze code line by line with detailed explanations."""
         lines = code.split('\n')
-        explanations = []
-        line_num = 1
+        # Each line is stripped exactly once; classification and explanation reuse it
+        stripped_lines = [line.strip() for line in lines]
+        kinds = self._classify_lines(stripped_lines)
+        # Functions defined in the snippet, collected once for the recursive-call check
+        func_names = {line.split()[1].split("(")[0] for line in lines if _DEF_LINE_RE.match(line)}
         
         # Build context knowledge for better explanations
         context_keywords = {}
@@ -133,47 +240,44 @@ class CodeExplainerRAG:
             if item.get('code_fragment'):
                 context_keywords.update(self._extract_code_patterns(item['code_fragment']))
         
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            
-            # Skip empty lines but keep them for line numbering
-            if not stripped:
-                explanations.append({
-                    "line_number": line_num,
-                    "code": line,
-                    "explanation": "Empty line (whitespace for readability)"
-                })
-                line_num += 1
-                continue
-            
-            # Skip comment-only lines but explain them
-            if self._is_comment_only(stripped, language):
-                explanations.append({
-                    "line_number": line_num,
-                    "code": line,
-                    "explanation": self._explain_comment(stripped, language)
-                })
-                line_num += 1
-                continue
-            
-            # Analyze the line
-            explanation = self._explain_line(stripped, line, language, context_keywords, i, lines)
-            explanations.append({
-                "line_number": line_num,
-                "code": line,
-                "explanation": explanation
-            })
-            line_num += 1
-        
-        return explanations
-
-    def _explain_line(self, stripped: str, original: str, language: str, 
-                     context: dict, line_index: int, all_lines: list[str]) -> str:
+        return [
+            self._explain_one(line_num, line, stripped, kind, language, context_keywords, func_names)
+            for line_num, (line, stripped, kind) in enumerate(zip(lines, stripped_lines, kinds), start=1)
+        ]
+
+    def _explain_one(self, line_num: int, line: str, stripped: str, kind: Optional[str],
+                     language: str, context: dict, func_names: set[str]) -> dict:
+        """Build the line_by_line entry for a single line of code."""
+        # Empty lines are kept for line numbering
+        if not stripped:
+            explanation = "Empty line (whitespace for readability)"
+        # Comment-only lines are explained as comments
+        elif self._is_comment_only(stripped, language):
+            explanation = self._explain_comment(stripped, language)
+        else:
+            explanation = self._explain_line(stripped, kind, language, context, func_names)
+        return {"line_number": line_num, "code": line, "explanation": explanation}
+
+    @staticmethod
+    def _classify_lines(stripped_lines: list[str]) -> list[Optional[str]]:
+        """Tag each stripped line with its _LINE_KIND_RE group, or None."""
+        line_starts = {}
+        offset = 0
+        for index, stripped in enumerate(stripped_lines):
+            line_starts[offset] = index
+            offset += len(stripped) + 1
+        kinds: list[Optional[str]] = [None] * len(stripped_lines)
+        for match in _LINE_KIND_RE.finditer("\n".join(stripped_lines)):
+            kinds[line_starts[match.start()]] = match.lastgroup
+        return kinds
+
+    def _explain_line(self, stripped: str, kind: Optional[str], language: str,
+                     context: dict, func_names: set[str]) -> str:
         """Generate explanation for a single line of code."""
         explanations = []
         
         # Include directives
-        if stripped.startswith("#include"):
+        if kind == "include":
             lib = stripped.replace("#include", "").strip().strip("<>\"")
             explanations.append(f"Includes the {lib} library, providing standard I/O functions")
             if "stdio.h" in lib:
@@ -182,8 +286,8 @@ class CodeExplainerRAG:
                 explanations.append("for memory management and utility functions")
         
         # Function definitions
-        elif re.match(r'\s*(def|int|void|float|double|char|bool)\s+\w+\s*\(', stripped):
-            func_match = re.search(r'(def|int|void|float|double|char|bool)\s+(\w+)\s*\(', stripped)
+        elif kind == "function":
+            func_match = _FUNC_NAME_RE.search(stripped)
             if func_match:
                 func_type = func_match.group(1)
                 func_name = func_match.group(2)
@@ -193,14 +297,14 @@ class CodeExplainerRAG:
                     explanations.append(f"Defines a {func_type} function named '{func_name}'")
                 
                 # Check for parameters
-                params = re.search(r'\(([^)]*)\)', stripped)
+                params = _PARAMS_RE.search(stripped)
                 if params and params.group(1).strip():
                     explanations.append(f"that takes parameters: {params.group(1).strip()}")
                 else:
                     explanations.append("that takes no parameters")
         
         # Return statements
-        elif stripped.startswith("return "):
+        elif kind == "return":
             return_expr = stripped.replace("return", "").strip()
             if return_expr == "0":
                 explanations.append("Returns 0 to indicate successful program termination")
@@ -212,7 +316,7 @@ class CodeExplainerRAG:
                 explanations.append(f"Returns the result: {return_expr}")
         
         # Conditional statements
-        elif stripped.startswith("if "):
+        elif kind == "conditional":
             condition = stripped.replace("if", "").strip().strip("():")
             if "n <= 1" in condition or "n < 2" in condition:
                 explanations.append("Base case check: if n is 0 or 1, return n directly")
@@ -224,8 +328,8 @@ class CodeExplainerRAG:
                 explanations.append("If true, executes the following block")
         
         # Variable declarations/assignments
-        elif re.match(r'\s*(int|float|double|char|bool|var|let|const)\s+\w+', stripped):
-            var_match = re.search(r'(int|float|double|char|bool|var|let|const)?\s*(\w+)\s*[=:]\s*(.+)', stripped)
+        elif kind == "declaration":
+            var_match = _VAR_ASSIGN_RE.search(stripped)
             if var_match:
                 var_type = var_match.group(1) or "variable"
                 var_name = var_match.group(2)
@@ -233,7 +337,7 @@ class CodeExplainerRAG:
                 explanations.append(f"Declares {var_type} '{var_name}' and initializes it to {var_value}")
         
         # Loop constructs
-        elif stripped.startswith("for ") or stripped.startswith("while "):
+        elif kind == "loop":
             if "for " in stripped:
                 if "in range" in stripped:
                     explanations.append("Iterates over a range of numbers")
@@ -245,7 +349,7 @@ class CodeExplainerRAG:
                 explanations.append("While loop: continues executing while condition is true")
         
         # Print/output statements
-        elif "printf" in stripped or "cout" in stripped or "print(" in stripped:
+        elif kind == "output":
             if "printf" in stripped:
                 explanations.append("Prints formatted output to the console")
             elif "cout" in stripped:
@@ -254,17 +358,16 @@ class CodeExplainerRAG:
                 explanations.append("Python print function: displays output to console")
         
         # Recursive calls
-        elif re.search(r'\w+\s*\([^)]*\)', stripped) and "=" not in stripped:
-            func_call = re.search(r'(\w+)\s*\(', stripped)
+        elif kind == "call":
+            func_call = _CALL_NAME_RE.search(stripped)
             if func_call:
                 func_name = func_call.group(1)
-                if func_name in [line.split()[1].split("(")[0] for line in all_lines 
-                                if re.match(r'\s*(def|int|void)\s+\w+', line)]:
+                if func_name in func_names:
                     explanations.append(f"Recursive call to '{func_name}' function")
                     explanations.append("This function calls itself with modified parameters")
         
         # Arithmetic operations
-        elif any(op in stripped for op in ["+", "-", "*", "/", "%"]):
+        elif kind == "arithmetic":
             if "fibonacci" in stripped.lower() or "fib" in stripped.lower():
                 explanations.append("Calculates Fibonacci by summing two recursive calls")
                 explanations.append("F(n) = F(n-1) + F(n-2)")
@@ -275,9 +378,8 @@ class CodeExplainerRAG:
         
         return ". ".join(explanations) + "."
 
-    def _is_comment_only(self, line: str, language: str) -> bool:
-        """Check if line contains only comments."""
-        stripped = line.strip()
+    def _is_comment_only(self, stripped: str, language: str) -> bool:
+        """Check if an already-stripped line contains only comments."""
         if language in ["c", "c++"]:
             return stripped.startswith("//") or stripped.startswith("/*")
         elif language == "python":
@@ -317,46 +419,47 @@ class CodeExplainerRAG:
         """Add new code example to knowledge base."""
         self.db.add_entry(payload.__dict__)
 
-    def _extract_keywords(self, code: str) -> str:
+    def _extract_keywords(self, features: CodeFeatures) -> str:
         """Extract meaningful keywords from code."""
         # Function/class names
-        func_pattern = r'\b(def|function|int|void|class)\s+(\w+)'
-        matches = re.findall(func_pattern, code)
+        matches = _KEYWORD_RE.findall(features.code)
         keywords = [match[1] for match in matches if len(match) > 1]
         
         # Algorithm names
-        algo_keywords = ["sort", "search", "fibonacci", "graph", "tree", "hash", "stack", "queue"]
-        found_algos = [kw for kw in algo_keywords if kw.lower() in code.lower()]
+        found_algos = [kw for kw in _ALGO_KEYWORDS if kw in features.keywords]
         
         return " ".join(keywords + found_algos)
 
-    def _analyze_structure(self, code: str) -> str:
+    @staticmethod
+    def _analyze_structure(code_features: CodeFeatures) -> str:
         """Analyze code structure and patterns."""
         features = []
+        raw = code_features.code_keywords
         
-        if re.search(r'\b(def|function|int|void)\s+\w+\s*\(', code):
+        if _STRUCT_RE.search(code_features.code):
             features.append("function definition")
-        if "if " in code or "if(" in code:
+        if "if " in raw or "if(" in raw:
             features.append("conditional logic")
-        if "for " in code or "while " in code:
+        if "for " in raw or "while " in raw:
             features.append("loop construct")
-        if "return " in code:
+        if "return " in raw:
             features.append("return statement")
-        if "class " in code:
+        if "class " in raw:
             features.append("class definition")
-        if "*" in code and ("int" in code or "char" in code):
+        if "*" in raw and ("int" in raw or "char" in raw):
             features.append("pointer usage")
-        if "[" in code and "]" in code:
+        if "[" in raw and "]" in raw:
             features.append("array/indexing")
         
         return ", ".join(features) if features else "basic structure"
 
-    def _generate_detailed_explanation(self, code: str, language: str, context: list[dict]) -> dict:
+    def _generate_detailed_explanation(self, features: CodeFeatures, language: str,
+                                       context: list[dict]) -> dict:
         """Generate comprehensive explanation using RAG context."""
         # Analyze what the code does
-        intent = self._infer_intent(code)
-        structure = self._analyze_code_structure(code, language)
-        patterns = self._identify_patterns(code, language)
+        intent = self._infer_intent(features)
+        structure = self._analyze_code_structure(features, language)
+        patterns = self._identify_patterns(features, language)
         
         # Build explanation from context
         context_insights = []
@@ -380,7 +483,7 @@ class CodeExplainerRAG:
         
         analysis_steps = [
             f"Identified primary purpose: {intent}",
-            f"Code structure analysis: {self._analyze_structure(code)}",
+            f"Code structure analysis: {self._analyze_structure(features)}",
             f"Pattern recognition: {patterns}",
         ]
         
@@ -389,15 +492,16 @@ class CodeExplainerRAG:
             "analysis_steps": analysis_steps
         }
 
-    def _analyze_code_structure(self, code: str, language: str) -> str:
+    def _analyze_code_structure(self, features: CodeFeatures, language: str) -> str:
         """Analyze the structural elements of the code."""
+        code = features.code
         lines = code.strip().split('\n')
         non_empty = [l.strip() for l in lines if l.strip() and not l.strip().startswith('//')]
         
         structure_desc = []
         
         # Function analysis
-        func_match = re.search(r'(def|int|void|function)\s+(\w+)\s*\(', code)
+        func_match = _CODE_FUNC_RE.search(code)
         if func_match:
             func_name = func_match.group(2)
             structure_desc.append(f"defines function '{func_name}'")
@@ -409,104 +513,106 @@ class CodeExplainerRAG:
                 structure_desc.append("uses recursive calls")
         
         # Loop analysis
-        if "for " in code or "while " in code:
+        if "for " in features.code_keywords or "while " in features.code_keywords:
             structure_desc.append("contains iterative loops")
         
         # Conditional analysis
-        if_count = code.count("if ")
+        if_count = features.if_count
         if if_count > 0:
             structure_desc.append(f"has {if_count} conditional branch{'es' if if_count > 1 else ''}")
         
         return "The code " + ", ".join(structure_desc) + "." if structure_desc else ""
 
-    def _identify_patterns(self, code: str, language: str) -> str:
+    def _identify_patterns(self, features: CodeFeatures, language: str) -> str:
         """Identify common programming patterns."""
         patterns = []
-        lowered = code.lower()
+        found = features.keywords
+        raw = features.code_keywords
         
         # Algorithm patterns
-        if "fibonacci" in lowered or "fib" in lowered:
+        if "fibonacci" in found or "fib" in found:
             patterns.append("Fibonacci sequence calculation")
-        if "sort" in lowered:
+        if "sort" in found:
             patterns.append("sorting algorithm")
-        if "search" in lowered or "find" in lowered:
+        if "search" in found or "find" in found:
             patterns.append("search algorithm")
-        if "graph" in lowered or "node" in lowered:
+        if "graph" in found or "node" in found:
             patterns.append("graph data structure")
         
         # Design patterns
-        if "class " in code and language in ["python", "c++"]:
+        if "class " in raw and language in ["python", "c++"]:
             patterns.append("object-oriented design")
-        if "template" in code:
+        if "template" in raw:
             patterns.append("generic programming")
-        if "*" in code and language in ["c", "c++"]:
+        if "*" in raw and language in ["c", "c++"]:
             patterns.append("pointer manipulation")
         
         # Control flow patterns
-        if "return " in code and code.count("return") > 1:
+        if "return " in raw and features.return_count > 1:
             patterns.append("early return pattern")
-        if "if " in code and "else" in code:
+        if "if " in raw and "else" in raw:
             patterns.append("conditional branching")
         
         return "Identified patterns: " + ", ".join(patterns) if patterns else "Standard implementation pattern"
 
     @staticmethod
-    def _infer_intent(code: str) -> str:
+    def _infer_intent(features: CodeFeatures) -> str:
         """Infer the primary intent/purpose of the code."""
-        lowered = code.lower()
+        found = features.keywords
+        raw = features.code_keywords
         
         # Specific algorithms
-        if "fibonacci" in lowered or "fib" in lowered:
+        if "fibonacci" in found or "fib" in found:
             return "a recursive Fibonacci sequence generator that calculates the nth Fibonacci number using the mathematical relationship F(n) = F(n-1) + F(n-2) with base cases for n <= 1"
         
-        if "quicksort" in lowered or ("sort" in lowered and "pivot" in lowered):
+        if "quicksort" in found or ("sort" in found and "pivot" in found):
             return "the Quicksort algorithm, a divide-and-conquer sorting method that partitions arrays around a pivot element"
         
-        if "mergesort" in lowered or ("sort" in lowered and "merge" in lowered):
+        if "mergesort" in found or ("sort" in found and "merge" in found):
             return "the Mergesort algorithm, which divides arrays into halves and merges sorted subarrays"
         
-        if "binary" in lowered and "search" in lowered:
+        if "binary" in found and "search" in found:
             return "binary search, an efficient O(log n) search algorithm for sorted arrays"
         
         # Data structures
-        if "graph" in lowered or ("node" in lowered and "neighbor" in lowered):
+        if "graph" in found or ("node" in found and "neighbor" in found):
             return "graph traversal, likely using depth-first or breadth-first search to visit all nodes"
         
-        if "tree" in lowered and ("node" in lowered or "leaf" in lowered):
+        if "tree" in found and ("node" in found or "leaf" in found):
             return "tree data structure operations, such as traversal or node manipulation"
         
-        if "stack" in lowered or ("push" in lowered and "pop" in lowered):
+        if "stack" in found or ("push" in found and "pop" in found):
             return "stack data structure with LIFO (Last In First Out) operations"
         
-        if "queue" in lowered or ("enqueue" in lowered and "dequeue" in lowered):
+        if "queue" in found or ("enqueue" in found and "dequeue" in found):
             return "queue data structure with FIFO (First In First Out) operations"
         
         # Common utilities
-        if "swap" in lowered:
+        if "swap" in found:
             return "a value swapping utility that exchanges two variables, often using temporary storage or pointer manipulation"
         
-        if "reverse" in lowered:
+        if "reverse" in found:
             return "string or array reversal algorithm"
         
-        if "factorial" in lowered or "fact" in lowered:
+        if "factorial" in found or "fact" in found:
             return "factorial calculation, typically using recursion"
         
         # Memory management
-        if "malloc" in lowered or "new " in lowered:
+        if "malloc" in found or "new " in found:
             return "dynamic memory allocation"
         
-        if "free" in lowered or "delete " in lowered:
+        if "free" in found or "delete " in found:
             return "memory deallocation and resource cleanup"
         
         # OOP patterns
-        if "class " in code and ("__init__" in lowered or "constructor" in lowered):
+        if "class " in raw and ("__init__" in found or "constructor" in found):
             return "an object-oriented class definition with initialization logic"
         
-        if "template" in code:
+        if "template" in raw:
             return "generic programming using templates for type-independent code"
         
         # Control flow
-        if "main()" in code or "int main" in code:
+        if "main()" in raw or "int main" in raw:
             return "a main program entry point that orchestrates function calls and program execution"
         
         # Default
@@ -519,10 +625,10 @@ class CodeExplainerRAG:
         return "; ".join(sentences[:3]) if sentences else "general programming best practices"
 
     @staticmethod
-    def _detailed_fallback_explanation(language: str, code: str) -> str:
+    def _detailed_fallback_explanation(language: str, features: CodeFeatures) -> str:
         """Generate detailed explanation when no context is available."""
-        intent = CodeExplainerRAG._infer_intent(code)
-        structure = CodeExplainerRAG._analyze_structure(code)
+        intent = CodeExplainerRAG._infer_intent(features)
+        structure = CodeExplainerRAG._analyze_structure(features)
         
         return (
             f"This {language} code implements {intent}. "
@@ -1,58 +1,438 @@
 from __future__ import annotations
 
-import json
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Sequence
+from typing import List, Optional, Sequence
 
+import hnswlib
 import numpy as np
-from sentence_transformers import SentenceTransformer
+import orjson
+import torch
+from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+ONNX_QUANTIZED_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+OPENVINO_QUANTIZED_FILE = "openvino/openvino_model_qint8_quantized.xml"
+MODEL_CACHE_DIR = Path(__file__).parent / ".models"
+MODEL_BACKENDS = ("onnx", "openvino", "torch")
+QUERY_CACHE_SIZE = 512
+# float32 in memory and on disk: BLAS has no float16 kernels, and a matching
+# on-disk dtype lets the matrix be memory-mapped without a per-process copy
+EMBEDDING_DTYPE = np.float32
+ENCODE_BATCH_SIZE = 64
+# Exact scoring is cheaper than graph traversal for small corpora
+HNSW_MIN_ENTRIES = 256
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# Concurrent searches arriving within MAX_WAIT seconds share one encode/score pass
+MAX_BATCH = 8
+MAX_WAIT = 0.005
+# Numeric suffix of generated entry ids such as "c-12"
+_ID_NUMBER_RE = re.compile(r"-(\d+)$")
+
+# CODE_EXPLAINER_THREADS caps intra-op threads when several workers share the CPU.
+# Each backend sizes its own pool, so this is passed to torch, ONNX Runtime and OpenVINO.
+INTRA_OP_THREADS = int(os.getenv("CODE_EXPLAINER_THREADS") or os.cpu_count() or 1)
+torch.set_num_threads(INTRA_OP_THREADS)
+
+
+@dataclass(frozen=True)
+class Hit:
+    """A search result: position in LocalVectorDB.entries and its cosine score."""
+    entry_id: int
+    score: float
 
 
 class LocalVectorDB:
-    def __init__(self, data_path: Path, embedder_name: str) -> None:
+    def __init__(self, data_path: Path, embedder_name: str, backend: str = "onnx") -> None:
         self.data_path = Path(data_path)
+        # Entries live in an append-only JSONL file; a legacy .json export is migrated on load
+        self.store_path = (
+            self.data_path if self.data_path.suffix == ".jsonl" else self.data_path.with_suffix(".jsonl")
+        )
+        # Hash and entry count of the seed .json the store was last built from
+        self.seed_state_path = self.data_path.with_suffix(".seed.json")
+        # Raw EMBEDDING_DTYPE rows, appended one per ingest; shape lives in the sidecar
+        self.embeddings_path = self.data_path.with_suffix(".f32")
+        self.meta_path = self.data_path.with_suffix(".meta.json")
+        self.index_path = self.data_path.with_suffix(".hnsw")
+        if backend not in MODEL_BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(MODEL_BACKENDS)}")
         self.embedder_name = embedder_name
-        self.model = SentenceTransformer(embedder_name)
+        self.backend = backend
+        # Loaded by load(), in the serving process: ONNX Runtime sessions do not
+        # survive a fork, so a model built before gunicorn --preload forks can hang.
+        self.model: Optional[SentenceTransformer] = None
         self.entries: list[dict] = []
-        self.embeddings: np.ndarray | None = None
+        self.embeddings: Optional[np.ndarray] = None
+        self.index: hnswlib.Index | None = None
+        # Running sha256 of the JSONL store, extended on every append
+        self._store_digest = hashlib.sha256()
+        # Leading embedding rows already in the saved index file, recorded in the sidecar
+        self._index_count = 0
+        # Number for the next generated id; above every existing one, so a
+        # shrunken seed cannot hand out an id that ingested entries already use
+        self._next_id = 1
+        # Guards entries/embeddings/index so readers never see them out of step
+        self._lock = threading.Lock()
+        # Serializes writers (load/ingest) so file appends stay in order
+        self._write_lock = threading.Lock()
+        # (row, label) pairs for the current index, added by the batcher thread
+        # between batches: hnswlib's add_items is not safe alongside knn_query.
+        self._pending_index_items: list[tuple[np.ndarray, int]] = []
+        # LRU of query vectors so repeated queries skip the transformer forward pass.
+        # Only the batcher thread touches it, so it needs no lock of its own.
+        self._query_cache: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._batcher = _QueryBatcher(self._search_batch)
 
     def load(self) -> None:
-        if not self.data_path.exists():
-            raise FileNotFoundError(f"Missing knowledge base at {self.data_path}")
-        with self.data_path.open("r", encoding="utf-8") as fh:
-            self.entries = json.load(fh)
-        self._recompute_embeddings()
-
-    def search(self, query: str, top_k: int = 3) -> list[dict]:
-        if not self.entries:
+        with self._write_lock:
+            if self.model is None:
+                self.model = self._load_model(self.embedder_name, self.backend)
+            entries = self._load_store()
+            embeddings = self._load_cached_embeddings(len(entries))
+            if embeddings is None:
+                embeddings = self._encode([self._entry_text(entry) for entry in entries])
+                embeddings = self._save_embeddings(embeddings)
+            index = self._load_index(embeddings)
+            numbers = (_ID_NUMBER_RE.search(str(entry.get("id", ""))) for entry in entries)
+            self._next_id = max([len(entries), *(int(m.group(1)) for m in numbers if m)]) + 1
+            with self._lock:
+                self.entries, self.embeddings, self.index = entries, embeddings, index
+                self._pending_index_items = []
+
+    def _load_store(self) -> list[dict]:
+        """Read the JSONL store, building or refreshing it from the seed .json.
+
+        The store holds the seed entries followed by everything ingested at
+        runtime. When the seed file changes, its entries are replaced with the
+        new seed and the ingested ones are kept.
+        """
+        has_seed = self.data_path != self.store_path and self.data_path.exists()
+        if not self.store_path.exists():
+            if not has_seed:
+                raise FileNotFoundError(f"Missing knowledge base at {self.data_path}")
+            seed = self.data_path.read_bytes()
+            entries = orjson.loads(seed)
+            self._write_store(entries)
+            self._write_seed_state(seed, len(entries))
+            return entries
+        entries = self._read_store()
+        if not has_seed:
+            return entries
+        seed = self.data_path.read_bytes()
+        state = self._read_seed_state()
+        if state is None:
+            # Store predates seed tracking: take its leading entries as the current seed
+            self._write_seed_state(seed, len(orjson.loads(seed)))
+        elif state["sha256"] != hashlib.sha256(seed).hexdigest():
+            seed_entries = orjson.loads(seed)
+            entries = seed_entries + entries[state["count"]:]
+            self._write_store(entries)
+            self._write_seed_state(seed, len(seed_entries))
+        return entries
+
+    def _read_store(self) -> list[dict]:
+        data = self.store_path.read_bytes()
+        # Every append ends in a newline, so anything after the last one is
+        # either a write cut short by a crash or a hand-edited final line.
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            try:
+                orjson.loads(data[end:])
+            except orjson.JSONDecodeError:
+                data = data[:end]
+                os.truncate(self.store_path, end)
+            else:
+                data += b"\n"
+                with self.store_path.open("ab") as fh:
+                    fh.write(b"\n")
+        self._store_digest = hashlib.sha256(data)
+        return [orjson.loads(line) for line in data.splitlines() if line.strip()]
+
+    def _read_seed_state(self) -> Optional[dict]:
+        try:
+            return orjson.loads(self.seed_state_path.read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+
+    def _write_seed_state(self, seed: bytes, count: int) -> None:
+        state = {"sha256": hashlib.sha256(seed).hexdigest(), "count": count}
+        self.seed_state_path.write_bytes(orjson.dumps(state, option=orjson.OPT_INDENT_2))
+
+    def search(self, query: str, top_k: int = 3) -> list[Hit]:
+        if not self.entries or top_k <= 0:
             return []
-        query_vec = self.model.encode([query], normalize_embeddings=True)[0]
-        scores = np.dot(self.embeddings, query_vec)
-        indices = np.argsort(scores)[::-1][:top_k]
-        results = []
-        for idx in indices:
-            item = self.entries[idx].copy()
-            item["score"] = float(scores[idx])
-            results.append(item)
-        return results
+        return self._batcher.submit(query, top_k)
+
+    def _search_batch(self, queries: list[str], top_ks: list[int]) -> list[list[Hit]]:
+        """Score a batch of queries with one encode and one matrix product."""
+        with self._lock:
+            embeddings, index = self.embeddings, self.index
+            pending, self._pending_index_items = self._pending_index_items, []
+        if pending:
+            index.add_items(np.vstack([vec for vec, _ in pending]), [label for _, label in pending])
+        query_vecs = self._encode_queries(queries)
+        count = embeddings.shape[0]
+        if index is not None:
+            labels, distances = index.knn_query(query_vecs, k=min(max(top_ks), count))
+            # Inner-product distance is 1 - cosine for normalized vectors
+            return [
+                [Hit(int(idx), float(1.0 - dist)) for idx, dist in zip(labels[row][:top_k], distances[row][:top_k])]
+                for row, top_k in enumerate(top_ks)
+            ]
+        # One BLAS GEMM scores the whole batch
+        scores = embeddings @ query_vecs.T
+        ranked = []
+        for column, top_k in enumerate(top_ks):
+            column_scores = scores[:, column]
+            # Partial selection: only the top-k candidates get sorted
+            k = min(top_k, count)
+            part = np.argpartition(-column_scores, k - 1)[:k]
+            indices = part[np.argsort(-column_scores[part])]
+            ranked.append([Hit(int(idx), float(column_scores[idx])) for idx in indices])
+        return ranked
+
+    def _encode_queries(self, queries: list[str]) -> np.ndarray:
+        cache = self._query_cache
+        missing = [query for query in dict.fromkeys(queries) if query not in cache]
+        if missing:
+            cache.update(zip(missing, self._encode(missing)))
+        for query in queries:
+            cache.move_to_end(query)
+        vecs = np.stack([cache[query] for query in queries])
+        while len(cache) > QUERY_CACHE_SIZE:
+            cache.popitem(last=False)
+        return vecs
 
     def add_entry(self, entry: dict) -> None:
-        entry["id"] = entry.get("id") or f"{entry['language']}-{len(self.entries)+1}"
-        self.entries.append(entry)
-        self._persist()
-        self._recompute_embeddings()
-
-    def _persist(self) -> None:
-        self.data_path.parent.mkdir(parents=True, exist_ok=True)
-        with self.data_path.open("w", encoding="utf-8") as fh:
-            json.dump(self.entries, fh, indent=2, ensure_ascii=False)
-
-    def _recompute_embeddings(self) -> None:
-        if not self.entries:
-            self.embeddings = np.zeros((0, 384))
-            return
-        corpus = [self._entry_text(entry) for entry in self.entries]
-        self.embeddings = self.model.encode(corpus, normalize_embeddings=True)
+        # Encode outside the lock so searches are not held up by the forward pass
+        vec = self._encode([self._entry_text(entry)])
+        with self._write_lock:
+            entry["id"] = entry.get("id") or f"{entry['language']}-{self._next_id}"
+            count = len(self.entries) + 1
+            store_size = self.store_path.stat().st_size
+            digest = self._store_digest.copy()
+            # Both files only grow, so existing maps of them stay valid
+            try:
+                self._persist(entry)
+                self._write_embedding_row(vec, count - 1)
+                self._write_meta(count)
+            except BaseException:
+                # Roll both files back so the next ingest's row lines up with its entry
+                os.truncate(self.store_path, store_size)
+                os.truncate(self.embeddings_path, (count - 1) * vec.nbytes)
+                self._store_digest = digest
+                raise
+            self._next_id += 1
+            embeddings = self._map_embeddings(count)
+            index = self.index
+            rebuilt = index is None or count > index.get_max_elements()
+            if rebuilt:
+                # Crossing the threshold or outgrowing capacity: build a fresh
+                # index outside the reader lock so searches keep using the old one.
+                index = self._build_index(embeddings)
+            with self._lock:
+                self.entries.append(entry)
+                self.embeddings = embeddings
+                if rebuilt:
+                    # The new index already holds every row
+                    self.index = index
+                    self._pending_index_items = []
+                else:
+                    self._pending_index_items.append((vec, count - 1))
+            if rebuilt and index is not None:
+                self._save_index(index, count)
+
+    def _write_embedding_row(self, vec: np.ndarray, row: int) -> None:
+        # Write at the row's offset rather than the end of the file, dropping any stale tail
+        with self.embeddings_path.open("r+b") as fh:
+            fh.seek(row * vec.nbytes)
+            fh.write(vec.tobytes())
+            fh.truncate()
+
+    def _persist(self, entry: dict) -> None:
+        line = orjson.dumps(entry) + b"\n"
+        self.store_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.store_path.open("ab") as fh:
+            fh.write(line)
+        self._store_digest.update(line)
+
+    def _write_store(self, entries: list[dict]) -> None:
+        data = b"".join(orjson.dumps(entry) + b"\n" for entry in entries)
+        self.store_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.store_path.with_suffix(".jsonl.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, self.store_path)
+        self._store_digest = hashlib.sha256(data)
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=EMBEDDING_DTYPE)
+        with torch.inference_mode():
+            embeddings = self.model.encode(
+                texts,
+                batch_size=ENCODE_BATCH_SIZE,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            )
+        return embeddings.astype(EMBEDDING_DTYPE)
+
+    def _fingerprint(self) -> dict:
+        """Identify the model the persisted embeddings were computed with."""
+        return {
+            "embedder_name": self.embedder_name,
+            "backend": self.backend,
+            "dtype": np.dtype(EMBEDDING_DTYPE).name,
+            "dim": self.model.get_sentence_embedding_dimension(),
+        }
+
+    def _write_meta(self, count: int) -> None:
+        meta = {
+            **self._fingerprint(),
+            "count": count,
+            "entries_sha256": self._store_digest.hexdigest(),
+            "index_count": self._index_count,
+        }
+        self.meta_path.write_bytes(orjson.dumps(meta, option=orjson.OPT_INDENT_2))
+
+    def _load_cached_embeddings(self, count: int) -> Optional[np.ndarray]:
+        if not (self.embeddings_path.exists() and self.meta_path.exists()):
+            return None
+        try:
+            meta = orjson.loads(self.meta_path.read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+        index_count = meta.pop("index_count", 0)
+        expected = {**self._fingerprint(), "count": count, "entries_sha256": self._store_digest.hexdigest()}
+        if meta != expected:
+            return None
+        # Too few rows means the cache is stale; extra rows are left over from a failed ingest
+        size = count * meta["dim"] * np.dtype(EMBEDDING_DTYPE).itemsize
+        if self.embeddings_path.stat().st_size < size:
+            return None
+        if self.embeddings_path.stat().st_size > size:
+            os.truncate(self.embeddings_path, size)
+        self._index_count = index_count
+        return self._map_embeddings(count)
+
+    def _save_embeddings(self, embeddings: np.ndarray) -> np.ndarray:
+        # Write to a temp file and swap it in so a mapped copy is never truncated
+        tmp_path = self.embeddings_path.with_suffix(".f32.tmp")
+        tmp_path.write_bytes(np.ascontiguousarray(embeddings, dtype=EMBEDDING_DTYPE).tobytes())
+        os.replace(tmp_path, self.embeddings_path)
+        # The saved index was built from the old rows
+        self._index_count = 0
+        # Number for the next generated id; above every existing one, so a
+        # shrunken seed cannot hand out an id that ingested entries already use
+        self._next_id = 1
+        self._write_meta(embeddings.shape[0])
+        return self._map_embeddings(embeddings.shape[0])
+
+    def _map_embeddings(self, count: int) -> np.ndarray:
+        # Serve from a read-only map so worker processes share the page cache
+        # instead of each holding a private copy of the matrix.
+        dim = self.model.get_sentence_embedding_dimension()
+        if count == 0:
+            return np.zeros((0, dim), dtype=EMBEDDING_DTYPE)
+        return np.memmap(self.embeddings_path, dtype=EMBEDDING_DTYPE, mode="r", shape=(count, dim))
+
+    def _load_index(self, embeddings: np.ndarray) -> hnswlib.Index | None:
+        """Reuse the saved index, adding rows ingested since it was written, or build a new one."""
+        count, dim = embeddings.shape
+        if count < HNSW_MIN_ENTRIES:
+            return None
+        saved = self._index_count
+        if 0 < saved <= count and self.index_path.exists():
+            index = hnswlib.Index(space="ip", dim=dim)
+            try:
+                index.load_index(str(self.index_path), max_elements=2 * count)
+            except RuntimeError:
+                index = None
+            if index is not None and index.get_current_count() == saved:
+                index.set_ef(HNSW_EF_SEARCH)
+                if saved < count:
+                    index.add_items(embeddings[saved:], np.arange(saved, count))
+                    self._save_index(index, count)
+                return index
+        index = self._build_index(embeddings)
+        self._save_index(index, count)
+        return index
+
+    def _save_index(self, index: hnswlib.Index, count: int) -> None:
+        # Ingests add to the in-memory graph only; rows past index_count are
+        # re-added from the embeddings on the next load.
+        tmp_path = self.index_path.with_suffix(".hnsw.tmp")
+        index.save_index(str(tmp_path))
+        os.replace(tmp_path, self.index_path)
+        self._index_count = count
+        self._write_meta(count)
+
+    @staticmethod
+    def _build_index(embeddings: np.ndarray) -> hnswlib.Index | None:
+        count, dim = embeddings.shape
+        if count < HNSW_MIN_ENTRIES:
+            return None
+        index = hnswlib.Index(space="ip", dim=dim)
+        # Leave headroom so ingests append in place until the corpus doubles
+        index.init_index(max_elements=2 * count, ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+        index.add_items(embeddings, np.arange(count))
+        index.set_ef(HNSW_EF_SEARCH)
+        return index
+
+    @staticmethod
+    def _load_model(embedder_name: str, backend: str) -> SentenceTransformer:
+        """Load the embedder, preferring INT8-quantized ONNX/OpenVINO weights on CPU."""
+        local_dir = MODEL_CACHE_DIR / f"{embedder_name.replace('/', '__')}-{backend}"
+        # export=False makes a missing file raise instead of silently exporting FP32 weights
+        if backend == "onnx":
+            import onnxruntime
+
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = INTRA_OP_THREADS
+            export_kwargs = {"provider": "CPUExecutionProvider", "session_options": session_options}
+            model_kwargs = {**export_kwargs, "file_name": ONNX_QUANTIZED_FILE, "export": False}
+            try:
+                return SentenceTransformer(embedder_name, backend="onnx", model_kwargs=model_kwargs)
+            except (OSError, ValueError):
+                pass
+            # No prequantized file published: export and quantize once into a local cache.
+            if not (local_dir / ONNX_QUANTIZED_FILE).exists():
+                model = SentenceTransformer(embedder_name, backend="onnx", model_kwargs=export_kwargs)
+                model.save(str(local_dir))
+                export_dynamic_quantized_onnx_model(model, "avx512_vnni", str(local_dir))
+            return SentenceTransformer(str(local_dir), backend="onnx", model_kwargs=model_kwargs)
+        if backend == "openvino":
+            ov_config = {"INFERENCE_NUM_THREADS": str(INTRA_OP_THREADS)}
+            try:
+                return SentenceTransformer(
+                    embedder_name,
+                    backend="openvino",
+                    model_kwargs={"file_name": OPENVINO_QUANTIZED_FILE, "export": False, "ov_config": ov_config},
+                )
+            except (OSError, ValueError):
+                pass
+            # Export from PyTorch with int8 weight compression once into a local cache.
+            if not any(local_dir.rglob("openvino_model.xml")):
+                model = SentenceTransformer(
+                    embedder_name,
+                    backend="openvino",
+                    model_kwargs={"export": True, "load_in_8bit": True, "ov_config": ov_config},
+                )
+                model.save(str(local_dir))
+            return SentenceTransformer(
+                str(local_dir), backend="openvino", model_kwargs={"export": False, "ov_config": ov_config}
+            )
+        return SentenceTransformer(embedder_name)
 
     @staticmethod
     def _entry_text(entry: dict) -> str:
@@ -63,4 +443,52 @@ class LocalVectorDB:
             entry.get("explanation", ""),
             " ".join(entry.get("tags", [])),
         ]
-        return " ".join(part for part in parts if part).strip()
\ No newline at end of file
+        return " ".join(part for part in parts if part).strip()
+
+
+class _QueryBatcher:
+    """Coalesces concurrent searches into batches served by a background thread."""
+
+    def __init__(self, handler) -> None:
+        self._handler = handler
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, query: str, top_k: int) -> list[Hit]:
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((query, top_k, future))
+        return future.result()
+
+    def _ensure_started(self) -> None:
+        # Started on first use so forked workers each get their own thread
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + MAX_WAIT
+            while len(batch) < MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            queries = [query for query, _, _ in batch]
+            top_ks = [top_k for _, top_k, _ in batch]
+            try:
+                results = self._handler(queries, top_ks)
+            except Exception as exc:
+                for _, _, future in batch:
+                    future.set_exception(exc)
+                continue
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)